@@ -2,29 +2,59 @@
 UI Components for MS Batch Generator
 """
 
+import importlib.util
+import io
+import ntpath
+import textwrap
+
 import streamlit as st
-import pandas as pd
-from streamlit_sortables import sort_items
 
 from config import (
-    INSTRUMENTS, FREQUENCY_RULES, NAMING_MODES, STEPS,
-    AGILENT_SAMPLE_TYPES, AGILENT_INJ_OPTIONS, HFX_SAMPLE_TYPES
+    INSTRUMENTS, INSTRUMENT_INDEX, PLATE_TYPES, PLATE_TYPE_INDEX, FREQUENCY_RULES, FREQUENCY_RULE_INDEX,
+    INTERVAL_RULES, NAMING_MODES, NAMING_MODE_INDEX, STEPS,
+    AGILENT_SAMPLE_TYPES, AGILENT_INJ_OPTIONS, HFX_SAMPLE_TYPES, HFX_LEVEL_TYPES,
+    AGILENT_TYPE_MAP, HFX_TYPE_MAP
 )
 from utils import (
-    reset_session_state, generate_sequence, generate_sample_name
+    reset_session_state, generate_sequence, summarize_sequence, build_sample_names,
+    find_duplicate_positions, format_auto_name, naming_inputs
 )
 
+# Static HTML fragments (built once at import, not per rerun)
+ALERT_HTML = '<div class="alert alert-{kind}">{message}</div>'
+
+FOOTER_HTML = """
+<div class="footer">
+    <strong>MS Batch Generator</strong> v2.0 · Built with Streamlit<br>
+    Supports Sciex7500 · AgilentQQQ · HFX-2
+</div>
+"""
+
+
+# ============================================================================
+# MARKDOWN HELPERS
+# ============================================================================
+
+def render_markdown(*parts):
+    """Render several markdown/HTML fragments with a single st.markdown call."""
+    st.markdown("\n\n".join(textwrap.dedent(part).strip() for part in parts), unsafe_allow_html=True)
+
 
 # ============================================================================
 # TABLE HELPER FUNCTIONS
 # ============================================================================
 
+def table_needs_rebuild(key_prefix):
+    """Whether the stored table for key_prefix is missing or flagged for reset."""
+    return f"{key_prefix}_df" not in st.session_state or st.session_state.get(f"{key_prefix}_needs_reset", False)
+
+
 def render_editable_table(df, key_prefix, column_config=None, height=400):
     """
     Render a simple editable table.
     
     Args:
-        df: DataFrame to display
+        df: Initial DataFrame, used only when the stored copy is (re)built
         key_prefix: Unique key prefix for this table
         column_config: Optional column configuration for st.data_editor
         height: Table height in pixels
@@ -35,7 +65,7 @@ def render_editable_table(df, key_prefix, column_config=None, height=400):
     df_key = f"{key_prefix}_df"
     
     # Store DataFrame in session state for persistence
-    if df_key not in st.session_state or st.session_state.get(f"{key_prefix}_needs_reset", False):
+    if table_needs_rebuild(key_prefix):
         st.session_state[df_key] = df.copy()
         st.session_state[f"{key_prefix}_needs_reset"] = False
     
@@ -71,6 +101,78 @@ def render_editable_table(df, key_prefix, column_config=None, height=400):
     return edited_df
 
 
+def sync_table_settings(key_prefix, settings, derived=None):
+    """
+    Write changed instrument settings into the stored table in place.
+    
+    Args:
+        key_prefix: Key prefix of the table in session state
+        settings: Dict of column name -> value applied to every row
+        derived: Optional dict of column name -> (inputs, build); build(stored_df)
+            recomputes the column whenever its inputs change
+    """
+    df_key = f"{key_prefix}_df"
+    settings_key = f"{key_prefix}_settings"
+    derived = derived or {}
+    previous = st.session_state.get(settings_key)
+    st.session_state[settings_key] = (settings, {column: inputs for column, (inputs, _) in derived.items()})
+    
+    # A fresh build picks up the settings anyway
+    if previous is None or table_needs_rebuild(key_prefix):
+        return
+    
+    previous_settings, previous_inputs = previous
+    stored_df = st.session_state[df_key]
+    for column, value in settings.items():
+        if previous_settings.get(column) != value and column in stored_df.columns:
+            stored_df[column] = value
+    for column, (inputs, build) in derived.items():
+        if previous_inputs.get(column) != inputs and column in stored_df.columns:
+            stored_df[column] = build(stored_df)
+
+
+def sciex_vial_positions(count, max_vials):
+    """Vial numbers 1..count; rows past the plate capacity fall back to vial 1."""
+    return [pos if pos <= max_vials else 1 for pos in range(1, count + 1)]
+
+
+def sciex_data_files(names, parent_folder):
+    """Data File paths as parent_folder\\name, or the bare names when no folder is set."""
+    import pandas as pd
+    if not parent_folder:
+        return names
+    # Same text as the old f-strings for any value (NaN, numbers, bytes)
+    return parent_folder + '\\' + pd.Series(names, dtype=object).map(str)
+
+
+# Rust-based xlsx reader when installed, openpyxl otherwise
+EXCEL_ENGINE = 'calamine' if importlib.util.find_spec('python_calamine') else 'openpyxl'
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def load_uploaded_table(file_bytes, file_name):
+    """Parse an uploaded CSV or Excel file. Cached on the file contents (last few uploads only)."""
+    import pandas as pd
+    buffer = io.BytesIO(file_bytes)
+    if file_name.endswith('.csv'):
+        return pd.read_csv(buffer)
+    return pd.read_excel(buffer, engine=EXCEL_ENGINE)
+
+
+def dataframe_to_csv(df):
+    """
+    Serialize a DataFrame to UTF-8 CSV bytes.
+    
+    Returns:
+        Tuple of (CSV with header row, CSV without header row)
+    """
+    buffer = io.BytesIO()
+    df.to_csv(buffer, index=False, header=True, encoding='utf-8')
+    csv_with_headers = buffer.getvalue()
+    # The headerless file is the same text minus its first line
+    return csv_with_headers, csv_with_headers.partition(b'\n')[2]
+
+
 # ============================================================================
 # SIDEBAR COMPONENTS
 # ============================================================================
@@ -78,7 +180,7 @@ def render_editable_table(df, key_prefix, column_config=None, height=400):
 def render_sidebar():
     """Render the sidebar with navigation."""
     with st.sidebar:
-        st.markdown("""
+        render_markdown("""
             <div class="sidebar-header">
                 <div class="sidebar-logo">⚗️</div>
                 <div>
@@ -86,10 +188,7 @@ def render_sidebar():
                     <div class="sidebar-subtitle">Worklist Generator</div>
                 </div>
             </div>
-        """, unsafe_allow_html=True)
-        
-        render_progress_stepper()
-        st.markdown("---")
+        """, _build_stepper_html(st.session_state.step), "---")
         
         # Help Manual
         with st.expander("📖 **How to Use**", expanded=False):
@@ -138,11 +237,9 @@ def render_sidebar():
             st.rerun()
 
 
-def render_progress_stepper():
-    """Render the step progress indicator."""
-    current_step = st.session_state.step
-    
-    st.markdown('<div class="stepper-container">', unsafe_allow_html=True)
+def _build_stepper_html(current_step):
+    """Build the stepper HTML for the given step (one string, one markdown call)."""
+    items = []
     for i, (step_name, step_num) in enumerate(STEPS, 1):
         if i < current_step:
             status, icon = "completed", "✓"
@@ -151,13 +248,12 @@ def render_progress_stepper():
         else:
             status, icon = "pending", step_num
         
-        st.markdown(f"""
-            <div class="step-item {status}">
-                <div class="step-number">{icon}</div>
-                <span>{step_name}</span>
-            </div>
-        """, unsafe_allow_html=True)
-    st.markdown('</div>', unsafe_allow_html=True)
+        items.append(
+            f'<div class="step-item {status}">'
+            f'<div class="step-number">{icon}</div><span>{step_name}</span>'
+            f'</div>'
+        )
+    return f'<div class="stepper-container">{"".join(items)}</div>'
 
 
 # ============================================================================
@@ -171,11 +267,10 @@ def render_step1_initial_setup():
     col1, col2 = st.columns(2)
     
     with col1:
-        current_idx = INSTRUMENTS.index(st.session_state.instrument) if st.session_state.instrument in INSTRUMENTS else None
         instrument = st.selectbox(
             "Select Instrument",
             options=INSTRUMENTS,
-            index=current_idx,
+            index=INSTRUMENT_INDEX.get(st.session_state.instrument),
             placeholder="Choose an instrument..."
         )
         st.session_state.instrument = instrument
@@ -196,7 +291,7 @@ def render_step1_initial_setup():
         )
         st.session_state.parent_folder = parent_folder
         
-        if parent_folder and st.session_state.instrument == 'AgilentQQQ' and not parent_folder.upper().startswith('D:'):
+        if parent_folder and st.session_state.instrument == 'AgilentQQQ' and ntpath.splitdrive(parent_folder)[0].upper() != 'D:':
             st.warning("⚠️ AgilentQQQ requires D: drive")
     
     if st.session_state.instrument and project_name:
@@ -237,9 +332,7 @@ def render_step2_sample_config():
     enabled_types = [t for t in st.session_state.sample_type_order if st.session_state.sample_types[t]['enabled']]
     
     if len(enabled_types) > 1:
-        st.markdown("---")
-        st.markdown("**🔀 Sequence Order** *(drag to reorder)*")
-        st.markdown("<div style='height: 8px'></div>", unsafe_allow_html=True)  # Spacer
+        render_markdown("---", "**🔀 Sequence Order** *(drag to reorder)*", "<div style='height: 8px'></div>")
         
         # Simple text labels
         key_to_label = {
@@ -253,7 +346,8 @@ def render_step2_sample_config():
         # Get current order as labels
         current_labels = [key_to_label[k] for k in enabled_types]
         
-        # Drag and drop sortable with container
+        # Drag and drop sortable with container (component only loaded once it is shown)
+        from streamlit_sortables import sort_items
         with st.container():
             sorted_labels = sort_items(current_labels, direction="horizontal")
         
@@ -272,9 +366,11 @@ def render_step2_sample_config():
     st.markdown("---")
     
     # === CONFIGURE EACH TYPE ===
-    active_types = [(name, st.session_state.sample_types[name]) for name in st.session_state.sample_type_order if st.session_state.sample_types[name]['enabled']]
-    
-    for type_name, config in active_types:
+    for type_name in st.session_state.sample_type_order:
+        config = st.session_state.sample_types[type_name]
+        if not config['enabled']:
+            continue
+        
         st.markdown(f"**{type_labels[type_name]}**")
         
         if type_name == 'samples':
@@ -288,11 +384,11 @@ def render_step2_sample_config():
                 count = st.number_input("Count", min_value=0, max_value=500, value=config['count'], key=f"count_{type_name}")
                 st.session_state.sample_types[type_name]['count'] = count
             with c2:
-                rule = st.selectbox("Rule", options=FREQUENCY_RULES, index=FREQUENCY_RULES.index(config['rule']) if config['rule'] in FREQUENCY_RULES else 0, key=f"rule_{type_name}")
+                rule = st.selectbox("Rule", options=FREQUENCY_RULES, index=FREQUENCY_RULE_INDEX.get(config['rule'], 0), key=f"rule_{type_name}")
                 st.session_state.sample_types[type_name]['rule'] = rule
             with c3:
                 current_rule = st.session_state.sample_types[type_name].get('rule', '')
-                if current_rule in ['At fixed interval', 'At start + fixed interval']:
+                if current_rule in INTERVAL_RULES:
                     interval = st.number_input("Every N samples", min_value=1, max_value=100, value=config.get('interval', 5), key=f"interval_{type_name}")
                     st.session_state.sample_types[type_name]['interval'] = interval
             
@@ -305,17 +401,16 @@ def render_step2_sample_config():
         
         st.markdown("---")
     
+    has_active = any(config['enabled'] and config['count'] > 0 for config in st.session_state.sample_types.values())
+    
     # === SUMMARY ===
-    if any(config['enabled'] and config['count'] > 0 for config in st.session_state.sample_types.values()):
-        sequence = generate_sequence(st.session_state.sample_types, st.session_state.get('sample_type_order'))
+    if has_active:
+        summary = summarize_sequence(st.session_state.sample_types, st.session_state.get('sample_type_order'))
         st.markdown("**Sequence Summary**")
-        summary = {}
-        for item in sequence:
-            summary[item['type']] = summary.get(item['type'], 0) + 1
         
         summary_cols = st.columns(len(summary) + 1)
         with summary_cols[0]:
-            st.metric("Total", len(sequence))
+            st.metric("Total", sum(summary.values()))
         for i, (stype, cnt) in enumerate(summary.items(), 1):
             with summary_cols[i]:
                 st.metric(stype, cnt)
@@ -327,7 +422,7 @@ def render_step2_sample_config():
             st.session_state.step = 1
             st.rerun()
     with col2:
-        if any(config['enabled'] and config['count'] > 0 for config in st.session_state.sample_types.values()):
+        if has_active:
             if st.button("Continue to Naming →", key='next_2', type="primary"):
                 st.session_state.step = max(st.session_state.step, 3)
                 st.rerun()
@@ -343,11 +438,11 @@ def render_step3_naming_rules():
     """Render Step 3: Sample Naming Rules."""
     st.subheader("✏️ Step 3: Sample Naming Rules")
     
-    naming_mode = st.selectbox("Naming Mode", options=NAMING_MODES, index=NAMING_MODES.index(st.session_state.naming_mode) if st.session_state.naming_mode in NAMING_MODES else 0)
+    naming_mode = st.selectbox("Naming Mode", options=NAMING_MODES, index=NAMING_MODE_INDEX.get(st.session_state.naming_mode, 0))
     st.session_state.naming_mode = naming_mode
     
     if naming_mode == 'Auto-build (Prefix + Index + Suffix)':
-        st.markdown('<div class="alert alert-info">💡 Names: Prefix_Index_Suffix (e.g., SPL_1_dil)</div>', unsafe_allow_html=True)
+        st.markdown(ALERT_HTML.format(kind='info', message='💡 Names: Prefix_Index_Suffix (e.g., SPL_1_dil)'), unsafe_allow_html=True)
         
         for type_name, config in st.session_state.sample_types.items():
             if config['enabled'] and config['count'] > 0:
@@ -364,24 +459,24 @@ def render_step3_naming_rules():
                     prefix_val = st.session_state.get(f"prefix_{type_name}", type_name[:3].upper())
                     idx_val = st.session_state.get(f"index_start_{type_name}", 1)
                     suffix_val = st.session_state.get(f"suffix_{type_name}", "")
-                    preview = f"{prefix_val}_{idx_val}_{suffix_val}" if suffix_val else f"{prefix_val}_{idx_val}"
-                    st.markdown(f'<div class="code-preview">Preview: {preview}, {prefix_val}_{idx_val+1}{"_"+suffix_val if suffix_val else ""}, ...</div>', unsafe_allow_html=True)
+                    preview = f"{format_auto_name(prefix_val, idx_val, suffix_val)}, {format_auto_name(prefix_val, idx_val + 1, suffix_val)}, ..."
+                    st.markdown(f'<div class="code-preview">Preview: {preview}</div>', unsafe_allow_html=True)
     
     elif naming_mode == 'Import from CSV/Excel':
         uploaded_file = st.file_uploader("Upload CSV or Excel file", type=['csv', 'xlsx'])
         if uploaded_file:
             try:
-                df = pd.read_csv(uploaded_file) if uploaded_file.name.endswith('.csv') else pd.read_excel(uploaded_file)
+                df = load_uploaded_table(uploaded_file.getvalue(), uploaded_file.name)
                 st.dataframe(df.head(), use_container_width=True)
                 name_column = st.selectbox("Select column with sample names", options=df.columns.tolist())
                 if name_column:
                     st.session_state.imported_names = df[name_column].tolist()
-                    st.markdown(f'<div class="alert alert-success">✓ Imported {len(st.session_state.imported_names)} names</div>', unsafe_allow_html=True)
+                    st.markdown(ALERT_HTML.format(kind='success', message=f'✓ Imported {len(st.session_state.imported_names)} names'), unsafe_allow_html=True)
             except Exception as e:
-                st.markdown(f'<div class="alert alert-error">✕ Error: {e}</div>', unsafe_allow_html=True)
+                st.markdown(ALERT_HTML.format(kind='error', message=f'✕ Error: {e}'), unsafe_allow_html=True)
     
     elif naming_mode == 'None':
-        st.markdown('<div class="alert alert-info">📝 Auto-numbered: Sample1, Sample2, QC1, etc.</div>', unsafe_allow_html=True)
+        st.markdown(ALERT_HTML.format(kind='info', message='📝 Auto-numbered: Sample1, Sample2, QC1, etc.'), unsafe_allow_html=True)
     
     col1, col2 = st.columns(2)
     with col1:
@@ -406,14 +501,18 @@ def render_step4_instrument_config():
     
     sequence = generate_sequence(st.session_state.sample_types, st.session_state.get('sample_type_order'))
     
-    if st.session_state.instrument == 'Sciex7500':
-        df = render_sciex7500_config(sequence)
-    elif st.session_state.instrument == 'AgilentQQQ':
-        df = render_agilent_config(sequence)
-    elif st.session_state.instrument == 'HFX-2':
-        df = render_hfx2_config(sequence)
-    else:
-        df = None
+    render_instrument = INSTRUMENT_RENDERERS.get(st.session_state.instrument)
+    df = render_instrument(sequence) if render_instrument else None
+    
+    if df is not None:
+        # Content hash of the final table; duplicate positions are only recomputed when it changes
+        import pandas as pd
+        df_hash = hash(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+        if st.session_state.get('sequence_df_hash') != df_hash:
+            st.session_state['sequence_df_hash'] = df_hash
+            st.session_state['duplicate_positions'] = find_duplicate_positions(df)
+        for position, names in st.session_state['duplicate_positions'].items():
+            st.warning(f"⚠️ Duplicate position {position}: {', '.join(map(str, names))}")
     
     col1, col2 = st.columns(2)
     with col1:
@@ -430,21 +529,27 @@ def render_step4_instrument_config():
 
 def render_sciex7500_config(sequence):
     """Render Sciex7500 configuration."""
-    col1, col2 = st.columns(2)
-    with col1:
-        ms_method = st.text_input("MS Method Path", value=st.session_state.ms_method, placeholder="D:\\Methods\\method.dam")
-        st.session_state.ms_method = ms_method
-        plate_type = st.selectbox("Plate Type", options=['1.5mL VT54 (54 vial)', 'MTP 96'], index=0 if st.session_state.plate_type == '1.5mL VT54 (54 vial)' else 1)
-        st.session_state.plate_type = plate_type
-        max_vials = 54 if plate_type == '1.5mL VT54 (54 vial)' else 96
-    
-    with col2:
-        lc_method = st.text_input("LC Method Path", value=st.session_state.lc_method, placeholder="D:\\Methods\\lc_method.lcm")
-        st.session_state.lc_method = lc_method
-        plate_number = st.selectbox("Plate Number", options=[1, 2, 3], index=st.session_state.plate_number - 1)
-        st.session_state.plate_number = plate_number
-        injection_volume = st.number_input("Injection Volume (µL)", min_value=0.01, max_value=100.0, value=st.session_state.injection_volume, step=0.1)
-        st.session_state.injection_volume = injection_volume
+    import pandas as pd
+    parent_folder = st.session_state.parent_folder
+    # Settings only apply on submit, so typing a path does not rerun the app
+    with st.form("sciex_cfg"):
+        col1, col2 = st.columns(2)
+        with col1:
+            ms_method = st.text_input("MS Method Path", value=st.session_state.ms_method, placeholder="D:\\Methods\\method.dam")
+            st.session_state.ms_method = ms_method
+            plate_type = st.selectbox("Plate Type", options=PLATE_TYPES['Sciex7500'], index=PLATE_TYPE_INDEX['Sciex7500'].get(st.session_state.plate_type, 0))
+            st.session_state.plate_type = plate_type
+            max_vials = 54 if plate_type == '1.5mL VT54 (54 vial)' else 96
+        
+        with col2:
+            lc_method = st.text_input("LC Method Path", value=st.session_state.lc_method, placeholder="D:\\Methods\\lc_method.lcm")
+            st.session_state.lc_method = lc_method
+            plate_number = st.selectbox("Plate Number", options=[1, 2, 3], index=st.session_state.plate_number - 1)
+            st.session_state.plate_number = plate_number
+            injection_volume = st.number_input("Injection Volume (µL)", min_value=0.01, max_value=100.0, value=st.session_state.injection_volume, step=0.1)
+            st.session_state.injection_volume = injection_volume
+        
+        st.form_submit_button("Apply")
     
     st.markdown(f"**Sample Table** — Max vials: {max_vials}")
     
@@ -452,30 +557,40 @@ def render_sciex7500_config(sequence):
         st.warning("⚠️ No samples configured. Go back to Step 2 to add samples.")
         return None
     
-    # Build initial DataFrame from sequence
-    data = []
-    for i, item in enumerate(sequence):
-        sample_name = generate_sample_name(item, st.session_state.naming_mode, sequence)
-        data.append({
-            'Sample Name': sample_name,
+    # Check if sequence or naming settings changed - reset stored DataFrame
+    seq_hash = hash((tuple(sequence), naming_inputs(sequence, st.session_state.naming_mode)))
+    if st.session_state.get('sciex_seq_hash') != seq_hash:
+        st.session_state['sciex_seq_hash'] = seq_hash
+        st.session_state['sciex_needs_reset'] = True
+    
+    sync_table_settings('sciex', {
+        'MS Method': ms_method,
+        'LC Method': lc_method,
+        'Plate Type': plate_type,
+        'Plate Number': plate_number,
+        'Injection Volume': injection_volume
+    }, derived={
+        'Vial Position': (max_vials, lambda table: sciex_vial_positions(len(table), max_vials)),
+        'Data File': (parent_folder, lambda table: sciex_data_files(table['Sample Name'], parent_folder))
+    })
+    
+    # Only build the table from the sequence when the stored copy is missing or stale
+    df = None
+    if table_needs_rebuild('sciex'):
+        # Build initial DataFrame from sequence (column-wise; scalars broadcast)
+        names = build_sample_names(sequence, st.session_state.naming_mode)
+        df = pd.DataFrame({
+            'Sample Name': names,
             'MS Method': ms_method,
             'LC Method': lc_method,
             'Rack Type': 'SIL-40 Drawer',
             'Plate Type': plate_type,
             'Plate Number': plate_number,
-            'Vial Position': i + 1 if i + 1 <= max_vials else 1,
+            'Vial Position': sciex_vial_positions(len(names), max_vials),
             'Injection Volume': injection_volume,
-            'Data File': f"{st.session_state.parent_folder}\\{sample_name}" if st.session_state.parent_folder else sample_name
+            'Data File': sciex_data_files(names, parent_folder)
         })
     
-    df = pd.DataFrame(data)
-    
-    # Check if sequence changed - reset stored DataFrame
-    seq_hash = hash(tuple([item['type'] + str(item['index']) for item in sequence]))
-    if st.session_state.get('sciex_seq_hash') != seq_hash:
-        st.session_state['sciex_seq_hash'] = seq_hash
-        st.session_state['sciex_needs_reset'] = True
-    
     st.caption("💡 **Double-click** cells to edit")
     
     edited_df = render_editable_table(df, key_prefix='sciex', height=400)
@@ -485,12 +600,17 @@ def render_sciex7500_config(sequence):
 
 def render_agilent_config(sequence):
     """Render Agilent QQQ configuration."""
-    col1, col2 = st.columns(2)
-    with col1:
-        ms_method = st.text_input("Instrument Method", value=st.session_state.ms_method, placeholder="D:\\Methods\\method.m")
-        st.session_state.ms_method = ms_method
-    with col2:
-        st.info("📁 Data Folder from Step 1")
+    import pandas as pd
+    parent_folder = st.session_state.parent_folder
+    with st.form("agilent_cfg"):
+        col1, col2 = st.columns(2)
+        with col1:
+            ms_method = st.text_input("Instrument Method", value=st.session_state.ms_method, placeholder="D:\\Methods\\method.m")
+            st.session_state.ms_method = ms_method
+        with col2:
+            st.info("📁 Data Folder from Step 1")
+        
+        st.form_submit_button("Apply")
     
     st.markdown("**Sample Table** — Position format: P1-A1 to P1-H12")
     
@@ -498,28 +618,31 @@ def render_agilent_config(sequence):
         st.warning("⚠️ No samples configured. Go back to Step 2 to add samples.")
         return None
     
-    data = []
-    for i, item in enumerate(sequence):
-        sample_name = generate_sample_name(item, st.session_state.naming_mode, sequence)
-        sample_type = {'Sample': 'Sample', 'Standard': 'Sample', 'QC': 'QC', 'Blank': 'Blank'}.get(item['type'], 'Sample')
-        data.append({
-            'Sample Name': sample_name,
+    # Check if sequence or naming settings changed - reset stored DataFrame
+    seq_hash = hash((tuple(sequence), naming_inputs(sequence, st.session_state.naming_mode)))
+    if st.session_state.get('agilent_seq_hash') != seq_hash:
+        st.session_state['agilent_seq_hash'] = seq_hash
+        st.session_state['agilent_needs_reset'] = True
+    
+    sync_table_settings('agilent', {
+        'Method': ms_method,
+        'Data Folder': parent_folder
+    })
+    
+    # Only build the table from the sequence when the stored copy is missing or stale
+    df = None
+    if table_needs_rebuild('agilent'):
+        names = build_sample_names(sequence, st.session_state.naming_mode)
+        df = pd.DataFrame({
+            'Sample Name': names,
             'Sample Position': '',
             'Method': ms_method,
-            'Data Folder': st.session_state.parent_folder,
-            'Data File': sample_name,
-            'Sample Type': sample_type,
+            'Data Folder': parent_folder,
+            'Data File': names,
+            'Sample Type': pd.Series([stype for stype, _ in sequence]).map(AGILENT_TYPE_MAP).fillna('Sample'),
             'Injection Volume': 'As method'
         })
     
-    df = pd.DataFrame(data)
-    
-    # Check if sequence changed - reset stored DataFrame
-    seq_hash = hash(tuple([item['type'] + str(item['index']) for item in sequence]))
-    if st.session_state.get('agilent_seq_hash') != seq_hash:
-        st.session_state['agilent_seq_hash'] = seq_hash
-        st.session_state['agilent_needs_reset'] = True
-    
     st.caption("💡 **Double-click** cells to edit")
     
     edited_df = render_editable_table(df, key_prefix='agilent', height=400)
@@ -529,15 +652,20 @@ def render_agilent_config(sequence):
 
 def render_hfx2_config(sequence):
     """Render HFX-2 configuration with full column format."""
-    col1, col2 = st.columns(2)
-    with col1:
-        ms_method = st.text_input("Instrument Method (.meth)", value=st.session_state.ms_method, placeholder="D:\\Methods\\method.meth")
-        st.session_state.ms_method = ms_method
-        if ms_method and not ms_method.endswith('.meth'):
-            st.warning("⚠️ Should have .meth extension")
-    with col2:
-        injection_volume = st.number_input("Injection Volume (µL)", min_value=0.01, max_value=100.0, value=st.session_state.injection_volume, step=0.1)
-        st.session_state.injection_volume = injection_volume
+    import pandas as pd
+    parent_folder = st.session_state.parent_folder
+    with st.form("hfx_cfg"):
+        col1, col2 = st.columns(2)
+        with col1:
+            ms_method = st.text_input("Instrument Method (.meth)", value=st.session_state.ms_method, placeholder="D:\\Methods\\method.meth")
+            st.session_state.ms_method = ms_method
+            if ms_method and not ms_method.endswith('.meth'):
+                st.warning("⚠️ Should have .meth extension")
+        with col2:
+            injection_volume = st.number_input("Injection Volume (µL)", min_value=0.01, max_value=100.0, value=st.session_state.injection_volume, step=0.1)
+            st.session_state.injection_volume = injection_volume
+        
+        st.form_submit_button("Apply")
     
     st.markdown("**Sample Table** — Position format: G:A1 to G:H12")
     
@@ -545,70 +673,79 @@ def render_hfx2_config(sequence):
         st.warning("⚠️ No samples configured. Go back to Step 2 to add samples.")
         return None
     
-    # HFX-2 full column format (matching instrument requirements)
-    data = []
-    for i, item in enumerate(sequence):
-        sample_name = generate_sample_name(item, st.session_state.naming_mode, sequence)
-        sample_type = {'Sample': 'Unknown', 'Standard': 'Std Bracket', 'QC': 'QC', 'Blank': 'Blank'}.get(item['type'], 'Unknown')
-        needs_level = sample_type in ['QC', 'Std Bracket', 'Std Update', 'Std Clear']
-        
-        data.append({
-            'Sample Type': sample_type,
-            'File Name': f"{sample_name}.raw",
-            'Sample ID': sample_name,
-            'Path': st.session_state.parent_folder,
+    # Check if sequence or naming settings changed - reset stored DataFrame
+    seq_hash = hash((tuple(sequence), naming_inputs(sequence, st.session_state.naming_mode)))
+    if st.session_state.get('hfx_seq_hash') != seq_hash:
+        st.session_state['hfx_seq_hash'] = seq_hash
+        st.session_state['hfx_needs_reset'] = True
+    
+    sync_table_settings('hfx', {
+        'Path': parent_folder,
+        'Instrument Method': ms_method,
+        'Inj Vol': injection_volume
+    })
+    
+    # Only build the table from the sequence when the stored copy is missing or stale
+    df = None
+    if table_needs_rebuild('hfx'):
+        # HFX-2 full column format (matching instrument requirements)
+        names = build_sample_names(sequence, st.session_state.naming_mode)
+        df = pd.DataFrame({
+            'Sample Type': pd.Categorical(
+                pd.Series([stype for stype, _ in sequence]).map(HFX_TYPE_MAP).fillna('Unknown'),
+                categories=HFX_SAMPLE_TYPES
+            ),
+            'File Name': pd.Series(names, dtype=object).map(str) + '.raw',
+            'Sample ID': names,
+            'Path': parent_folder,
             'Instrument Method': ms_method,
             'Position': '',
             'Inj Vol': injection_volume,
             'Dil Factor': 1,
-            'Sample Name': sample_name
+            'Sample Name': names
         })
     
-    df = pd.DataFrame(data)
-    
-    # Check if sequence changed - reset stored DataFrame
-    seq_hash = hash(tuple([item['type'] + str(item['index']) for item in sequence]))
-    if st.session_state.get('hfx_seq_hash') != seq_hash:
-        st.session_state['hfx_seq_hash'] = seq_hash
-        st.session_state['hfx_needs_reset'] = True
-    
     st.caption("💡 **Double-click** cells to edit")
     
     edited_df = render_editable_table(df, key_prefix='hfx', height=400)
     
-    # Build full DataFrame for export with all HFX columns
-    full_data = []
-    for i, row in edited_df.iterrows():
-        full_row = {
-            'Sample Type': row.get('Sample Type', 'Unknown'),
-            'File Name': row.get('File Name', ''),
-            'Sample ID': row.get('Sample ID', ''),
-            'Path': row.get('Path', st.session_state.parent_folder),
-            'Instrument Method': row.get('Instrument Method', ms_method),
-            'Process Method': '',
-            'Calibration File': '',
-            'Position': row.get('Position', ''),
-            'Inj Vol': row.get('Inj Vol', injection_volume),
-            'Level': 1 if row.get('Sample Type', '') in ['QC', 'Std Bracket', 'Std Update', 'Std Clear'] else '',
-            'Sample Wt': '',
-            'Sample Vol': '',
-            'ISTD Amt': '',
-            'Dil Factor': row.get('Dil Factor', 1),
-            'L1 Study': '',
-            'L2 Client': '',
-            'L3 Laboratory': '',
-            'L4 Company': '',
-            'L5 Phone': '',
-            'Comment': '',
-            'Sample Name': row.get('Sample Name', '')
-        }
-        full_data.append(full_row)
-    
-    full_df = pd.DataFrame(full_data)
+    # Build full DataFrame for export with all HFX columns (column-wise; scalars broadcast)
+    rows = edited_df.reset_index(drop=True)
+    full_df = pd.DataFrame({
+        'Sample Type': rows['Sample Type'],
+        'File Name': rows['File Name'],
+        'Sample ID': rows['Sample ID'],
+        'Path': rows['Path'],
+        'Instrument Method': rows['Instrument Method'],
+        'Process Method': '',
+        'Calibration File': '',
+        'Position': rows['Position'],
+        'Inj Vol': rows['Inj Vol'],
+        'Level': rows['Sample Type'].isin(HFX_LEVEL_TYPES).map({True: 1, False: ''}),
+        'Sample Wt': '',
+        'Sample Vol': '',
+        'ISTD Amt': '',
+        'Dil Factor': rows['Dil Factor'],
+        'L1 Study': '',
+        'L2 Client': '',
+        'L3 Laboratory': '',
+        'L4 Company': '',
+        'L5 Phone': '',
+        'Comment': '',
+        'Sample Name': rows['Sample Name']
+    })
     st.session_state.sequence_df = full_df
     return full_df
 
 
+# Step 4 table renderer per instrument
+INSTRUMENT_RENDERERS = {
+    'Sciex7500': render_sciex7500_config,
+    'AgilentQQQ': render_agilent_config,
+    'HFX-2': render_hfx2_config,
+}
+
+
 # ============================================================================
 # STEP 5: EXPORT
 # ============================================================================
@@ -629,14 +766,10 @@ def render_step5_export():
         with col2:
             filename = st.text_input("Output filename", value=f"{st.session_state.project_name}.csv" if st.session_state.project_name else "batch.csv")
         
-        csv_data = df.to_csv(index=False, header=include_headers)
-        csv_with_headers = df.to_csv(index=False, header=True)
+        csv_with_headers, csv_without_headers = dataframe_to_csv(df)
+        csv_data = csv_with_headers if include_headers else csv_without_headers
         
-        col1, col2 = st.columns(2)
-        with col1:
-            st.download_button("📥 Download CSV", data=csv_data, file_name=filename, mime="text/csv", use_container_width=True)
-        with col2:
-            st.download_button("📥 Download (with headers)", data=csv_with_headers, file_name=f"headers_{filename}", mime="text/csv", use_container_width=True)
+        st.download_button("📥 Download CSV", data=csv_data, file_name=filename, mime="text/csv", use_container_width=True)
         
         st.success("✓ Ready to export!")
     
@@ -647,10 +780,5 @@ def render_step5_export():
 
 def render_footer():
     """Render the app footer."""
-    st.markdown("""
-        <div class="footer">
-            <strong>MS Batch Generator</strong> v2.0 · Built with Streamlit<br>
-            Supports Sciex7500 · AgilentQQQ · HFX-2
-        </div>
-    """, unsafe_allow_html=True)
+    st.markdown(FOOTER_HTML, unsafe_allow_html=True)
 
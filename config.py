@@ -15,6 +15,7 @@ TEMPLATES_FILE = 'saved_templates.json'
 
 # Instrument options
 INSTRUMENTS = ['Sciex7500', 'AgilentQQQ', 'HFX-2']
+INSTRUMENT_INDEX = {name: i for i, name in enumerate(INSTRUMENTS)}
 
 # Plate types per instrument
 PLATE_TYPES = {
@@ -22,12 +23,27 @@ PLATE_TYPES = {
     'AgilentQQQ': ['96-well plate'],
     'HFX-2': ['96-well plate']
 }
+PLATE_TYPE_INDEX = {
+    instrument: {plate: i for i, plate in enumerate(plates)}
+    for instrument, plates in PLATE_TYPES.items()
+}
 
 # Sample placement rules
 FREQUENCY_RULES = ['At the start only', 'At the end only', 'At fixed interval', 'At start + fixed interval']
+FREQUENCY_RULE_INDEX = {rule: i for i, rule in enumerate(FREQUENCY_RULES)}
+INTERVAL_RULES = ['At fixed interval', 'At start + fixed interval']
+
+# Sample type keys -> display names used in the sequence
+SAMPLE_TYPE_DISPLAY = {
+    'standards': 'Standard',
+    'samples': 'Sample',
+    'qc': 'QC',
+    'blanks': 'Blank'
+}
 
 # Naming modes
 NAMING_MODES = ['None', 'Auto-build (Prefix + Index + Suffix)', 'Enter each name manually', 'Import from CSV/Excel']
+NAMING_MODE_INDEX = {mode: i for i, mode in enumerate(NAMING_MODES)}
 
 # Default sample type configuration
 DEFAULT_SAMPLE_TYPES = {
@@ -50,4 +66,9 @@ STEPS = [
 AGILENT_SAMPLE_TYPES = ['No injection', 'Blank', 'Sample', 'QC']
 AGILENT_INJ_OPTIONS = ['No injection', 'As method']
 HFX_SAMPLE_TYPES = ['Blank', 'Unknown', 'QC', 'Std Bracket', 'Std Update', 'Std Clear', 'Start Bracket']
+HFX_LEVEL_TYPES = frozenset({'QC', 'Std Bracket', 'Std Update', 'Std Clear'})  # HFX types that carry Level 1
+
+# Sequence type -> instrument Sample Type value
+AGILENT_TYPE_MAP = {'Sample': 'Sample', 'Standard': 'Sample', 'QC': 'QC', 'Blank': 'Blank'}
+HFX_TYPE_MAP = {'Sample': 'Unknown', 'Standard': 'Std Bracket', 'QC': 'QC', 'Blank': 'Blank'}
 
@@ -3,10 +3,18 @@ Utility functions for MS Batch Generator
 """
 
 import streamlit as st
+import collections
+import copy
+import functools
 import json
 import os
 import re
-from config import TEMPLATES_FILE, DEFAULT_SAMPLE_TYPES
+import stat
+import tempfile
+from config import TEMPLATES_FILE, DEFAULT_SAMPLE_TYPES, INTERVAL_RULES, SAMPLE_TYPE_DISPLAY
+
+# Project name format (e.g., MPG_25-12_GaIEMA)
+_PROJECT_NAME_RE = re.compile(r'^[A-Za-z]{2,3}_\d{2}-\d{2}_\w+$')
 
 
 # ============================================================================
@@ -20,10 +28,11 @@ def init_session_state():
         'instrument': None,
         'project_name': '',
         'parent_folder': '',
-        'sample_types': DEFAULT_SAMPLE_TYPES.copy(),
+        'sample_types': copy.deepcopy(DEFAULT_SAMPLE_TYPES),
         'sample_type_order': ['standards', 'samples', 'qc', 'blanks'],  # Default order
         'naming_mode': 'None',
         'naming_config': {},
+        'imported_names': None,
         'sequence_df': None,
         'templates': {},
         'ms_method': '',
@@ -33,40 +42,68 @@ def init_session_state():
         'injection_volume': 1.0,
     }
     for key, value in defaults.items():
-        if key not in st.session_state:
-            if isinstance(value, dict):
-                st.session_state[key] = value.copy()
-            else:
-                st.session_state[key] = value
+        st.session_state.setdefault(key, value)
 
 
 def reset_session_state():
     """Reset all session state to defaults."""
-    for key in list(st.session_state.keys()):
-        del st.session_state[key]
+    st.session_state.clear()
 
 
 # ============================================================================
 # TEMPLATE MANAGEMENT
 # ============================================================================
 
+@st.cache_data(show_spinner=False)
+def _load_templates_cached(mtime):
+    """Parse the templates file. Cached per file modification time."""
+    try:
+        with open(TEMPLATES_FILE, 'r') as f:
+            return json.load(f)
+    except (json.JSONDecodeError, IOError):
+        return {}
+
+
 def load_templates():
     """Load saved templates from JSON file."""
-    if os.path.exists(TEMPLATES_FILE):
+    try:
+        mtime = os.path.getmtime(TEMPLATES_FILE)
+    except OSError:
+        return {}
+    return _load_templates_cached(mtime)
+
+
+def _write_templates(templates):
+    """Write all templates to the JSON file (compact encoding, atomic replace)."""
+    # Unique temp file next to the target so concurrent saves never share it
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(TEMPLATES_FILE) or '.', suffix='.tmp')
+    replaced = False
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(templates, f, separators=(',', ':'))
+        # mkstemp creates the file as 0600; keep the permissions a plain open() would give
         try:
-            with open(TEMPLATES_FILE, 'r') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
-            return {}
-    return {}
+            mode = stat.S_IMODE(os.stat(TEMPLATES_FILE).st_mode)
+        except OSError:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        os.chmod(tmp_file, mode)
+        os.replace(tmp_file, TEMPLATES_FILE)
+        replaced = True
+    finally:
+        if not replaced:
+            os.unlink(tmp_file)
+    _load_templates_cached.clear()
 
 
 def save_template(name, config):
     """Save a configuration template."""
     templates = load_templates()
+    if templates.get(name) == config:
+        return
     templates[name] = config
-    with open(TEMPLATES_FILE, 'w') as f:
-        json.dump(templates, f, indent=2)
+    _write_templates(templates)
 
 
 def delete_template(name):
@@ -74,8 +111,7 @@ def delete_template(name):
     templates = load_templates()
     if name in templates:
         del templates[name]
-        with open(TEMPLATES_FILE, 'w') as f:
-            json.dump(templates, f, indent=2)
+        _write_templates(templates)
 
 
 # ============================================================================
@@ -84,14 +120,62 @@ def delete_template(name):
 
 def validate_project_name(name):
     """Validate project name format (e.g., MPG_25-12_GaIEMA)."""
-    pattern = r'^[A-Za-z]{2,3}_\d{2}-\d{2}_\w+$'
-    return bool(re.match(pattern, name)) if name else False
+    # Cheap checks first: the shortest valid name is 10 characters with two underscores
+    if not name or len(name) < 10 or name.count('_') < 2:
+        return False
+    return _PROJECT_NAME_RE.match(name) is not None
+
+
+def find_duplicate_positions(df):
+    """
+    Find vial/plate positions assigned to more than one row.
+    
+    Returns:
+        Dict of position -> list of sample names sharing it (blank positions are ignored)
+    """
+    columns = set(df.columns)
+    pos_col = next((c for c in ('Vial Position', 'Position', 'Sample Position') if c in columns), None)
+    if pos_col is None:
+        return {}
+    name_col = 'Sample Name' if 'Sample Name' in columns else df.columns[0]
+    
+    # Vectorized scan; only rows that actually collide are grouped
+    positions = df[pos_col].fillna('').astype(str).str.strip()
+    filled = positions.ne('')
+    if not filled.any():  # No positions entered yet
+        return {}
+    dup_mask = positions.duplicated(keep=False) & filled
+    if not dup_mask.any():
+        return {}
+    return df.loc[dup_mask].groupby(positions[dup_mask], sort=False)[name_col].agg(list).to_dict()
 
 
 # ============================================================================
 # SEQUENCE GENERATION
 # ============================================================================
 
+# Normalized per-type settings used by sequence generation (hashable, attribute access)
+SampleTypeConfig = collections.namedtuple(
+    'SampleTypeConfig', ['enabled', 'count', 'rule', 'interval', 'start_count']
+)
+
+
+def normalize_sample_types(sample_types):
+    """Convert the session-state config dicts into SampleTypeConfig tuples with defaults filled in."""
+    configs = {}
+    for type_key in SAMPLE_TYPE_DISPLAY:
+        config = sample_types.get(type_key, {})
+        count = config.get('count', 0)
+        configs[type_key] = SampleTypeConfig(
+            enabled=bool(config.get('enabled')),
+            count=count,
+            rule=config.get('rule', ''),
+            interval=config.get('interval', 0),
+            start_count=config.get('start_count', count),
+        )
+    return configs
+
+
 def generate_sequence(sample_types, type_order=None):
     """
     Generate the sample sequence based on frequency rules.
@@ -109,127 +193,236 @@ def generate_sequence(sample_types, type_order=None):
     Args:
         sample_types: Dict of sample type configurations
         type_order: List defining order of types (default: ['standards', 'samples', 'qc', 'blanks'])
-    """
-    sequence = []
     
+    Returns:
+        List of (display type, index) tuples, e.g. ('QC', 1)
+    """
     # Default order if not specified
     if type_order is None:
         type_order = ['standards', 'samples', 'qc', 'blanks']
     
-    # Map type names to display names
-    type_display = {
-        'standards': 'Standard',
-        'samples': 'Sample', 
-        'qc': 'QC',
-        'blanks': 'Blank'
-    }
-    
-    # Get all type configs
-    type_configs = {
-        'standards': sample_types.get('standards', {}),
-        'samples': sample_types.get('samples', {}),
-        'qc': sample_types.get('qc', {}),
-        'blanks': sample_types.get('blanks', {})
-    }
-    
-    def includes_interval(rule):
-        return rule in ['At fixed interval', 'At start + fixed interval']
+    # Canonical, hashable form of the configuration for the memo lookup
+    config_key = tuple(normalize_sample_types(sample_types).items())
+    return list(_generate_sequence_cached(config_key, tuple(type_order)))
+
+
+@functools.lru_cache(maxsize=32)
+def _generate_sequence_cached(config_key, type_order):
+    """Build the sequence for a canonical configuration key (see generate_sequence)."""
+    return tuple(_build_sequence(dict(config_key), type_order))
+
+
+def _build_sequence(configs, type_order):
+    """Place each sample type according to its frequency rule."""
+    sequence = []
+    disabled = SampleTypeConfig(False, 0, '', 0, 0)
     
     # Helper to add a repeating block (indices reset: 1, 2, 3... each time)
     def add_block(stype, count, sequence):
         for i in range(1, count + 1):
-            sequence.append({'type': stype, 'index': i})
+            sequence.append((stype, i))
     
     # Get interval settings for interval-based types
     interval_types = {}  # type_key -> (interval, count)
     for type_key in type_order:
-        config = type_configs.get(type_key, {})
-        if config.get('enabled') and includes_interval(config.get('rule', '')):
-            interval_types[type_key] = (config.get('interval', 0), config.get('count', 0))
+        config = configs.get(type_key, disabled)
+        if config.enabled and config.rule in INTERVAL_RULES:
+            interval_types[type_key] = (config.interval, config.count)
     
     # === START ITEMS (in order) - excludes 'samples' which is always main sequence ===
     for type_key in type_order:
         if type_key == 'samples':  # Samples are always in main sequence, not start/end
             continue
             
-        config = type_configs.get(type_key, {})
-        display_name = type_display.get(type_key, type_key.title())
+        config = configs.get(type_key, disabled)
+        display_name = SAMPLE_TYPE_DISPLAY.get(type_key, type_key.title())
         
-        if not config.get('enabled'):
+        if not config.enabled:
             continue
-            
-        rule = config.get('rule', '')
         
         # "At the start only" - add full count at start
-        if rule == 'At the start only':
-            add_block(display_name, config.get('count', 0), sequence)
+        if config.rule == 'At the start only':
+            add_block(display_name, config.count, sequence)
         
         # "At start + fixed interval" - add configurable start count at start
-        elif rule == 'At start + fixed interval':
-            start_count = config.get('start_count', config.get('count', 0))
-            add_block(display_name, start_count, sequence)
+        elif config.rule == 'At start + fixed interval':
+            add_block(display_name, config.start_count, sequence)
         
         # "At fixed interval" - DO NOT add at start, only at intervals
         # (handled in main sequence loop below)
     
     # === MAIN SEQUENCE ===
-    sample_counter = 0
-    
     # Only 'samples' goes in main sequence (standards/qc/blanks use start/end/interval rules)
-    main_types = ['samples'] if type_configs.get('samples', {}).get('enabled') else []
-    
-    # Process main sequence (samples)
-    for type_key in main_types:
-        config = type_configs.get(type_key, {})
-        display_name = type_display.get(type_key, type_key.title())
-        item_count = config.get('count', 0)
+    samples = configs['samples']
+    if samples.enabled:
+        display_name = SAMPLE_TYPE_DISPLAY['samples']
+        item_count = samples.count
         
-        for i in range(1, item_count + 1):
-            sequence.append({'type': display_name, 'index': i})
-            sample_counter += 1
+        # Interval blocks can only fall on multiples of their interval, so jump
+        # between those points and add the samples in between in bulk
+        due_points = sorted({
+            n for interval, _ in interval_types.values() if interval > 0
+            for n in range(interval, item_count + 1, interval)
+        })
+        
+        next_index = 1
+        for point in due_points:
+            sequence.extend((display_name, i) for i in range(next_index, point + 1))
+            next_index = point + 1
             
             # Add interval blocks after every N samples (in order)
-            for interval_key in type_order:
-                if interval_key in interval_types:
-                    interval, count = interval_types[interval_key]
-                    if interval > 0 and sample_counter % interval == 0:
-                        add_block(type_display.get(interval_key, interval_key.title()), count, sequence)
+            for interval_key, (interval, count) in interval_types.items():
+                if interval > 0 and point % interval == 0:
+                    add_block(SAMPLE_TYPE_DISPLAY.get(interval_key, interval_key.title()), count, sequence)
+        
+        sequence.extend((display_name, i) for i in range(next_index, item_count + 1))
     
     # === END ITEMS (in order) - excludes 'samples' which is always main sequence ===
     for type_key in type_order:
         if type_key == 'samples':  # Samples are always in main sequence, not start/end
             continue
             
-        config = type_configs.get(type_key, {})
-        display_name = type_display.get(type_key, type_key.title())
+        config = configs.get(type_key, disabled)
+        display_name = SAMPLE_TYPE_DISPLAY.get(type_key, type_key.title())
         
-        if config.get('enabled') and config.get('rule') == 'At the end only':
-            add_block(display_name, config.get('count', 0), sequence)
+        if config.enabled and config.rule == 'At the end only':
+            add_block(display_name, config.count, sequence)
     
     return sequence
 
 
-def generate_sample_name(item, naming_mode, sequence=None):
-    """Generate a sample name based on the naming mode."""
-    type_name = item['type'].lower()
-    idx = item['index']
+def summarize_sequence(sample_types, type_order=None):
+    """
+    Count items per display type without building the sequence.
+    
+    Applies the same placement rules as generate_sequence, in closed form.
+    Keys are ordered by where each type first appears in the run.
+    """
+    if type_order is None:
+        type_order = ['standards', 'samples', 'qc', 'blanks']
+    
+    enabled = {k: c for k, c in normalize_sample_types(sample_types).items() if c.enabled}
+    summary = {}
+    
+    def add(type_key, n):
+        if n > 0:
+            name = SAMPLE_TYPE_DISPLAY.get(type_key, type_key.title())
+            summary[name] = summary.get(name, 0) + n
+    
+    # Start items
+    for type_key in type_order:
+        config = enabled.get(type_key)
+        if type_key == 'samples' or not config:
+            continue
+        if config.rule == 'At the start only':
+            add(type_key, config.count)
+        elif config.rule == 'At start + fixed interval':
+            add(type_key, config.start_count)
+    
+    # Samples, then interval blocks in the order they first fall due
+    sample_count = max(enabled['samples'].count, 0) if 'samples' in enabled else 0
+    add('samples', sample_count)
+    
+    interval_keys = [k for k in type_order if k in enabled and enabled[k].rule in INTERVAL_RULES]
+    for type_key in sorted(interval_keys, key=lambda k: enabled[k].interval):
+        interval = enabled[type_key].interval
+        if interval > 0:
+            add(type_key, (sample_count // interval) * enabled[type_key].count)
+    
+    # End items
+    for type_key in type_order:
+        config = enabled.get(type_key)
+        if type_key != 'samples' and config and config.rule == 'At the end only':
+            add(type_key, config.count)
+    
+    return summary
+
+
+def format_auto_name(prefix, number, suffix=""):
+    """Format an auto-built name as Prefix_Index or Prefix_Index_Suffix."""
+    if suffix:
+        return f"{prefix}_{number}_{suffix}"
+    return f"{prefix}_{number}"
+
+
+def make_namer(naming_mode, naming_params=None, imported_names=None):
+    """
+    Resolve the naming mode once and return a namer(item, import_position) function.
     
-    if naming_mode == 'None':
-        return f"{item['type']}{idx}"
-    elif naming_mode == 'Auto-build (Prefix + Index + Suffix)':
-        prefix = st.session_state.get(f"prefix_{type_name}", type_name[:3].upper())
-        suffix = st.session_state.get(f"suffix_{type_name}", "")
-        index_start = st.session_state.get(f"index_start_{type_name}", 1)
+    Args:
+        naming_mode: One of NAMING_MODES
+        naming_params: Dict of lowercase type name -> (prefix, suffix, index_start)
+        imported_names: List of imported names, or None
+    """
+    def default_name(item, import_position=None):
+        stype, idx = item
+        return f"{stype}{idx}"
+    
+    if naming_mode == 'Auto-build (Prefix + Index + Suffix)':
+        params = naming_params or {}
         
-        if suffix:
-            return f"{prefix}_{index_start + idx - 1}_{suffix}"
-        return f"{prefix}_{index_start + idx - 1}"
-    elif naming_mode == 'Import from CSV/Excel' and hasattr(st.session_state, 'imported_names'):
-        names = st.session_state.imported_names
-        if sequence:
-            total_idx = sum(1 for s in sequence[:sequence.index(item)] if s['type'] == item['type'])
-            if total_idx < len(names):
-                return names[total_idx]
-    
-    return f"{item['type']}{idx}"
+        def auto_name(item, import_position=None):
+            stype, idx = item
+            type_name = stype.lower()
+            prefix, suffix, index_start = params.get(type_name, (type_name[:3].upper(), "", 1))
+            return format_auto_name(prefix, index_start + idx - 1, suffix)
+        return auto_name
+    
+    if naming_mode == 'Import from CSV/Excel' and imported_names is not None:
+        def imported_name(item, import_position=None):
+            if import_position is not None and import_position < len(imported_names):
+                return imported_names[import_position]
+            return default_name(item)
+        return imported_name
+    
+    return default_name
+
 
+def naming_inputs(sequence, naming_mode):
+    """
+    Snapshot the session-state inputs that sample names are built from.
+    
+    Returns:
+        Hashable tuple of (naming_mode, naming_params, imported_names)
+    """
+    naming_params = ()
+    if naming_mode == 'Auto-build (Prefix + Index + Suffix)':
+        naming_params = tuple(sorted(
+            (type_name, (
+                st.session_state.get(f"prefix_{type_name}", type_name[:3].upper()),
+                st.session_state.get(f"suffix_{type_name}", ""),
+                st.session_state.get(f"index_start_{type_name}", 1),
+            ))
+            for type_name in {stype.lower() for stype, _ in sequence}
+        ))
+    imported_names = None
+    if naming_mode == 'Import from CSV/Excel' and st.session_state.imported_names is not None:
+        imported_names = tuple(st.session_state.imported_names)
+    return naming_mode, naming_params, imported_names
+
+
+def build_sample_names(sequence, naming_mode):
+    """Resolve the names for a whole sequence from the current naming settings."""
+    naming_mode, naming_params, imported_names = naming_inputs(sequence, naming_mode)
+    namer = make_namer(naming_mode, dict(naming_params), imported_names)
+    if imported_names is not None:
+        return [namer(item, position) for item, position in zip(sequence, _imported_name_positions(sequence))]
+    return [namer(item) for item in sequence]
+
+
+def _imported_name_positions(sequence):
+    """
+    Map each item to its position in the imported names list, in a single pass.
+    
+    An item's position is the number of same-type items before its first occurrence,
+    so repeated interval items (e.g. QC1 in every block) reuse the same name.
+    """
+    type_counts = {}
+    first_positions = {}
+    positions = []
+    for item in sequence:
+        stype = item[0]
+        count = type_counts.get(stype, 0)
+        positions.append(first_positions.setdefault(item, count))
+        type_counts[stype] = count + 1
+    return positions